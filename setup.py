@@ -8,10 +8,15 @@ setup(
     author_email='giulio.massacci@istat.it',
     packages=find_packages(),
     install_requires=[
+        'numpy>=1.17',
         'pandas>=1.0',
         'networkx>=2.0',
-        'distinctiveness>=0.1.5',
+        'scipy>=1.4',
     ],
+    extras_require={
+        'numba': ['numba>=0.50'],
+        'pyarrow': ['pyarrow>=7.0'],
+    },
     python_requires='>=3.8',
     classifiers=[
         'Programming Language :: Python :: 3',
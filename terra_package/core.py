@@ -1,27 +1,41 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import numpy as np
 import pandas as pd
-import networkx as nx
-from .metrics import calculate_node_metrics
+import scipy.sparse as sp
+from .metrics import calculate_node_metrics_sparse
 from .utils import TerraDataset
 
-def analyze_network(df: TerraDataset) -> pd.DataFrame:
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+def analyze_network(df: TerraDataset, n_jobs: int = 1) -> pd.DataFrame:
     """
     Compute network metrics for each node in a directed trade network across periods.
 
-    The function converts each period of the input TerraDataset into a directed
-    NetworkX graph and computes node-level metrics using `calculate_node_metrics`.
-    Results from all periods are concatenated into a single DataFrame.
+    The function converts each period of the input TerraDataset into a sparse
+    weighted adjacency matrix and computes node-level metrics using
+    `calculate_node_metrics_sparse`. Periods are independent of each other and
+    can be processed in parallel. Results from all periods are concatenated
+    into a single DataFrame.
 
     Parameters
     ----------
     df : TerraDataset
         A validated TerraDataset object containing at least the
         columns ['source', 'target', 'period', 'product', 'qty'], and optionally 'flow' and 'value'.
+    n_jobs : int, optional
+        Number of worker processes used to analyze the periods. Default is 1,
+        which processes the periods sequentially in the current process.
+        If None, as many workers as the available CPUs are used.
     
     Returns
     -------
     pd.DataFrame
         A DataFrame containing node metrics for each period, as returned
-        by `calculate_node_metrics`.
+        by `calculate_node_metrics_sparse`.
 
     Raises
     ------
@@ -32,21 +46,37 @@ def analyze_network(df: TerraDataset) -> pd.DataFrame:
         raise TypeError("This function only accepts TerraDataset.")
     
     df = df.data
-    all_metrics = []
-    period = sorted(df['period'].unique())
-    for p in period:
-        df_p = df[df['period'] == p].copy()
-        edge_attr = 'qty' if 'qty' in df_p.columns else None
-        G_p = nx.from_pandas_edgelist(df_p, 'source', 'target',
-                                        edge_attr=edge_attr, create_using=nx.DiGraph())
-        metrics_df = calculate_node_metrics(G_p, p)
+    # TerraDataset is already sorted by period, so groups come out in order
+    grouped = list(df.groupby('period', sort=False, observed=True))
+    period = [p for p, _ in grouped]
+    period_dfs = [df_p for _, df_p in grouped]
 
-        all_metrics.append(metrics_df)
-        print(f"Processed period: {p}")
+    all_metrics = []
+    with ProcessPoolExecutor(max_workers=n_jobs) if n_jobs != 1 else nullcontext() as executor:
+        results = executor.map(_analyze_one_period, period_dfs, period) if executor else map(_analyze_one_period, period_dfs, period)
+        for p, metrics_df in zip(period, results):
+            all_metrics.append(metrics_df)
+            print(f"Processed period: {p}")
 
     full_metrics_df = pd.concat(all_metrics, ignore_index=True)
     return full_metrics_df
 
+def _analyze_one_period(df_p: pd.DataFrame, p) -> pd.DataFrame:
+    """
+    Build the sparse adjacency matrix of a single period and compute its node metrics.
+    """
+    # Interleave source and target so nodes keep their order of appearance
+    keys = np.column_stack([df_p['source'].to_numpy(), df_p['target'].to_numpy()]).ravel()
+    # A missing source or target is kept as a NaN node, as networkx does
+    try:
+        codes, nodes = pd.factorize(keys, use_na_sentinel=False)
+    except TypeError:
+        # pandas < 1.5
+        codes, nodes = pd.factorize(keys, na_sentinel=None)
+    A_p = sp.csr_matrix((df_p['qty'].to_numpy(dtype=np.float64), (codes[0::2], codes[1::2])),
+                        shape=(len(nodes), len(nodes)))
+    return calculate_node_metrics_sparse(A_p, nodes, p)
+
 def analyze_basket(df: TerraDataset, country: str, partner:str = None, product: str = None, var: bool = False, direction: str = "E") -> pd.DataFrame:
     """
     Analyze the trade basket of a given country, optionally filtering by partner
@@ -74,7 +104,8 @@ def analyze_basket(df: TerraDataset, country: str, partner:str = None, product:
         Default is False.
     direction : {'E', 'I'}, optional
         Trade direction: 'E' for exports (default), 'I' for imports. When 'I'
-        is selected, source and target are swapped.
+        is selected, the country is matched against the target column and the
+        partner against the source column.
 
     Returns
     -------
@@ -96,28 +127,26 @@ def analyze_basket(df: TerraDataset, country: str, partner:str = None, product:
     if direction not in ["E", "I"]:
         raise ValueError("Direction must be 'E' for exports or 'I' for imports.")
     
-    df = df.data
-    if direction in ["I"]:
-        df.loc[:, ['source', 'target']] = df[['target', 'source']].values
-    df = df[df['source'] == country]
-    if df.empty:
+    data = df.data
+    country_col, partner_col = ('source', 'target') if direction == "E" else ('target', 'source')
+    mask = data[country_col] == country
+    if not mask.any():
         raise ValueError(f"Country {country} in direction {direction} is not present in the dataset.")
     if product:
-        df = df[df['product'] == product]
-    if df.empty:
-        raise ValueError(f"Product {product} in direction {direction} is not present in the dataset.")
+        mask &= data['product'] == product
+        if not mask.any():
+            raise ValueError(f"Product {product} in direction {direction} is not present in the dataset.")
     if partner:
-        df = df[df['target'] == partner]
-    if df.empty:
-        raise ValueError(f"Partner {partner} in direction {direction} is not present in the dataset.")
+        mask &= data[partner_col] == partner
+        if not mask.any():
+            raise ValueError(f"Partner {partner} in direction {direction} is not present in the dataset.")
 
-    df = df.groupby(['period'], as_index=False)['qty'].sum()
+    df = data.loc[mask, ['period', 'qty']].groupby('period', sort=True, observed=True, as_index=False)['qty'].sum()
 
     if var:
-        df = df.groupby(['period'], as_index=False)["qty"].sum().sort_values(by=['period'], ascending=True)
         df["qty_lag"] = df["qty"].shift(1)
         df["qty"] = (df["qty"]-df["qty_lag"])/df["qty_lag"]
-    return df[['period', 'qty']]
+    return _plain_keys(df[['period', 'qty']])
 
 def simulate_shock(df: TerraDataset, country_from: str, country_to: str, period:str, product: str = None, sigma: int = 5) -> TerraDataset:
     """
@@ -160,11 +189,15 @@ def simulate_shock(df: TerraDataset, country_from: str, country_to: str, period:
         If the selected period is not present.
         If filtering by product results in an empty dataset.
         If the shock is not applicable (i.e., the shocked country is the sole supplier).
+        If `sigma` is 1, for which the CES price index is undefined.
     """
 
     if not isinstance(df, TerraDataset):
         raise TypeError("This function only accepts TerraDataset.")
     
+    if sigma == 1:
+        raise ValueError("sigma must be different from 1 in the CES demand system.")
+    
     data = df.data.copy()
     data = data[data["period"] == period]
     
@@ -173,38 +206,122 @@ def simulate_shock(df: TerraDataset, country_from: str, country_to: str, period:
     
     if product:
         data = data[data["product"] == product]
-        if df.empty:
+        if data.empty:
             raise ValueError(f"No data found for product {product} trade by {country_from}.")
     else:
-        data.groupby(["source","target","product"], as_index=False)[["qty", "value"]].sum()
+        data.groupby(["source","target","product"], observed=True, as_index=False)[["qty", "value"]].sum()
 
     if data[(data.source != country_from) & (data.target == country_to)].empty:
         raise ValueError(f"Simulation not applicable, since there is only {country_from} as supplier for {country_to}.")
     
     df_shock = data[data.target == country_to].copy()
-    df_shock["price"] = df_shock["value"] / df_shock["qty"]
-    df_shock["alpha"] = df_shock["qty"] * df_shock["price"]**(sigma - 1)
-    df_shock["alpha"] = df_shock["alpha"] / df_shock["alpha"].sum()
-
-    Q_tot = df_shock["qty"].sum()
-    df_shock["weight"] = df_shock["alpha"] * df_shock["price"]**(1 - sigma)
-    df_shock["share_base"] = df_shock["weight"] / df_shock["weight"].sum()
-    P = (df_shock["alpha"] * df_shock["price"]**(1 - sigma)).sum()**(1 / (1 - sigma))
-    E = P * Q_tot
-    df_shock["q_base"] = df_shock["share_base"] * E / df_shock["price"]
-    
-    df_shock.loc[df_shock.source == country_from, "alpha"] = 0
+    ces_cols = ["price", "alpha", "share_base", "share_post", "q_base", "q_new", "q_delta"]
+    ces_kernel = _ces_shock_jit if _ces_shock_jit is not None else _ces_shock_numpy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ces = ces_kernel(df_shock["qty"].to_numpy(dtype=np.float64), df_shock["value"].to_numpy(dtype=np.float64),
+                         (df_shock["source"] == country_from).to_numpy(), sigma)
+    for col, values in zip(ces_cols, ces):
+        df_shock[col] = values
+    df.simulation = _plain_keys(df_shock[["source", "target", "period", "product", "qty", "value", "price", "alpha", "share_base", "share_post", "q_base", "q_new", "q_delta"]])
+    return df
 
-    df_shock["weight"] = df_shock["alpha"] * df_shock["price"]**(1 - sigma)
-    if df_shock["weight"].sum() != 0:
-        df_shock["share_post"] = df_shock["weight"] / df_shock["weight"].sum()
-    else:
-        df_shock["share_post"] = 0
-
-    P_new = (df_shock["alpha"] * df_shock["price"]**(1 - sigma)).sum()**(1 / (1 - sigma))
-    E_new = P_new * Q_tot
-    # Add a check to avoid division by zero if Prezzo is zero
-    df_shock["q_new"] = df_shock.apply(lambda row: row["share_post"] * E_new / row["price"] if row["price"] != 0 else 0, axis=1)
-    df_shock["q_delta"] = df_shock["q_new"] - df_shock["q_base"]
-    df.simulation = df_shock[["source", "target", "period", "product", "qty", "value", "price", "alpha", "share_base", "share_post", "q_base", "q_new", "q_delta"]]
-    return df
\ No newline at end of file
+def _plain_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the categorical key columns of a result back to the dtype they
+    were read with, so that the categorical storage of TerraDataset does not
+    leak into the returned values.
+    """
+    return df.astype({c: df[c].cat.categories.dtype for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+
+def _ces_shock_numpy(qty, value, is_shocked, sigma):
+    """
+    Compute, with vectorized NumPy operations, the CES prices, preference
+    weights, shares and quantities before and after removing the shocked
+    suppliers.
+
+    Returns the arrays (price, alpha, share_base, share_post, q_base, q_new,
+    q_delta), where alpha is the post-shock preference weight.
+    """
+    price = value / qty
+    price_pow = np.power(price, 1 - sigma)
+    alpha = qty / price_pow
+    # Like pandas sums, the totals skip NaN (e.g. flows with zero qty and value)
+    alpha = alpha / np.nansum(alpha)
+    q_tot = qty.sum()
+
+    weight = alpha * price_pow
+    w_sum = np.nansum(weight)
+    share_base = weight / w_sum
+    alpha = np.where(is_shocked, 0.0, alpha)
+    weight = alpha * price_pow
+    w_sum_post = np.nansum(weight)
+    share_post = weight / w_sum_post if w_sum_post != 0 else np.zeros_like(weight)
+
+    E = np.power(w_sum, 1 / (1 - sigma)) * q_tot
+    E_new = np.power(w_sum_post, 1 / (1 - sigma)) * q_tot
+    q_base = share_base * E / price
+    # Avoid division by zero if the price is zero
+    q_new = np.where(price != 0, share_post * E_new / np.where(price == 0, 1, price), 0.0)
+    q_delta = q_new - q_base
+
+    return price, alpha, share_base, share_post, q_base, q_new, q_delta
+
+def _ces_shock(qty, value, is_shocked, sigma):
+    """
+    Compute, in a few passes over the flows towards the importer, the CES
+    prices, preference weights, shares and quantities before and after
+    removing the shocked suppliers. Same results as ``_ces_shock_numpy``,
+    written as explicit loops to be compiled with numba.
+
+    Returns the arrays (price, alpha, share_base, share_post, q_base, q_new,
+    q_delta), where alpha is the post-shock preference weight.
+    """
+    n = qty.shape[0]
+    price = np.empty(n)
+    price_pow = np.empty(n)
+    alpha = np.empty(n)
+    share_base = np.empty(n)
+    share_post = np.empty(n)
+    q_base = np.empty(n)
+    q_new = np.empty(n)
+    q_delta = np.empty(n)
+
+    # Like pandas sums, the totals skip NaN (e.g. flows with zero qty and value)
+    alpha_sum = 0.0
+    q_tot = 0.0
+    for i in range(n):
+        price[i] = value[i] / qty[i]
+        price_pow[i] = np.power(price[i], 1 - sigma)
+        alpha[i] = qty[i] / price_pow[i]
+        if not np.isnan(alpha[i]):
+            alpha_sum += alpha[i]
+        q_tot += qty[i]
+
+    w_sum = 0.0
+    w_sum_post = 0.0
+    for i in range(n):
+        alpha[i] = alpha[i] / alpha_sum
+        share_base[i] = alpha[i] * price_pow[i]
+        if is_shocked[i]:
+            alpha[i] = 0.0
+        share_post[i] = alpha[i] * price_pow[i]
+        if not np.isnan(share_base[i]):
+            w_sum += share_base[i]
+        if not np.isnan(share_post[i]):
+            w_sum_post += share_post[i]
+
+    E = np.power(w_sum, 1 / (1 - sigma)) * q_tot
+    E_new = np.power(w_sum_post, 1 / (1 - sigma)) * q_tot
+    for i in range(n):
+        share_base[i] = share_base[i] / w_sum
+        share_post[i] = share_post[i] / w_sum_post if w_sum_post != 0 else 0.0
+        q_base[i] = share_base[i] * E / price[i]
+        # Avoid division by zero if the price is zero
+        q_new[i] = share_post[i] * E_new / price[i] if price[i] != 0 else 0.0
+        q_delta[i] = q_new[i] - q_base[i]
+
+    return price, alpha, share_base, share_post, q_base, q_new, q_delta
+
+# The fused loops only pay off when compiled: without numba the vectorized
+# _ces_shock_numpy is used instead
+_ces_shock_jit = njit(cache=True, error_model="numpy")(_ces_shock) if njit is not None else None
@@ -1,8 +1,13 @@
+import numpy as np
 import pandas as pd
 import networkx as nx
-from distinctiveness.dc import distinctiveness
-import io
-from contextlib import redirect_stdout
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 def calculate_node_metrics(G: nx.Graph, period: str) -> pd.DataFrame:
     """
@@ -35,13 +40,13 @@ def calculate_node_metrics(G: nx.Graph, period: str) -> pd.DataFrame:
         - ``Out Degree`` : Weighted out-degree (directed graphs only).
         - ``In Degree`` : Weighted in-degree (directed graphs only).
         - ``Vulnerability`` : Defined as ``1 - in_degree`` when in-degree > 0,
-          otherwise 0.
+          otherwise 0 (directed graphs only).
         - ``Closeness`` : Closeness centrality computed using inverse weight
           as distance.
         - ``Betweenness`` : Betweenness centrality computed using inverse
           weight as edge weight.
-        - ``Distinctiveness`` : Distinctiveness centrality (D1), computed via
-          the external ``distinctiveness`` package on the undirected version
+        - ``Distinctiveness`` : Distinctiveness centrality (D1, with
+          ``alpha=1`` and normalization) computed on the undirected version
           of the graph.
 
     Notes
@@ -49,9 +54,11 @@ def calculate_node_metrics(G: nx.Graph, period: str) -> pd.DataFrame:
     - All edge weights are normalized by dividing by the total sum of weights
       in the graph prior to computing any metric.
     - In directed graphs, the closeness and betweenness centrality take
-      direction into account.
+      direction into account. Shortest paths are computed with
+      ``scipy.sparse.csgraph.dijkstra``; edges with zero weight are ignored.
     - Distinctiveness centrality (D1) is always computed on an undirected
-      version of the graph for stability.
+      version of the graph for stability: self-loops are ignored and the
+      weights of reciprocal arcs are summed.
 
     Raises
     ------
@@ -61,40 +68,184 @@ def calculate_node_metrics(G: nx.Graph, period: str) -> pd.DataFrame:
         the dataset.
     """
 
-    total_weight = sum(d.get("qty", 0) for _, _, d in G.edges(data=True))
-    for _, _, d in G.edges(data=True):
-        d["weight"] = (d.get("qty", 0) / total_weight) if total_weight > 0 else 0
-    
-    deg = dict(G.degree(weight="weight"))
-    out_deg = dict(G.out_degree(weight="weight")) if G.is_directed() else {n: None for n in G.nodes()}
-    in_deg = dict(G.in_degree(weight="weight")) if G.is_directed() else {n: None for n in G.nodes()}
-
-    vulnerability = {}
-    for k, v in in_deg.items():
-        if v != 0:
-            vulnerability[k] = 1 - v
-        else:
-            vulnerability[k] = 0
-    
-    inv_w = {(u, v): 1/d["weight"] if d.get("weight", 0) > 0 else 1e9999
-                for u, v, d in G.edges(data=True)}
-    nx.set_edge_attributes(G, inv_w, "inv_weight")
-    clos = nx.closeness_centrality(G, distance="inv_weight")
-    betw = nx.betweenness_centrality(G, weight="inv_weight")
-
-    with redirect_stdout(io.StringIO()):  
-        disti = distinctiveness(G.to_undirected(), alpha = 1, normalize = True, measures = ["D1"])["D1"]
-    
+    edges = list(G.edges())
+    qty = np.fromiter((q for _, _, q in G.edges(data="qty", default=0)), dtype=np.float64, count=len(edges))
+    total_weight = qty.sum()
+    w = qty / total_weight if total_weight > 0 else np.zeros_like(qty)
+    nx.set_edge_attributes(G, dict(zip(edges, w.tolist())), "weight")
+
+    # Each edge is stored once, also in undirected graphs
+    nodes = list(G.nodes())
+    node_index = {n: i for i, n in enumerate(nodes)}
+    src = np.fromiter((node_index[u] for u, _ in edges), dtype=np.intp, count=len(edges))
+    tgt = np.fromiter((node_index[v] for _, v in edges), dtype=np.intp, count=len(edges))
+    A = sp.csr_matrix((qty, (src, tgt)), shape=(len(nodes), len(nodes)))
+
+    return calculate_node_metrics_sparse(A, nodes, period, directed=G.is_directed())
+
+def calculate_node_metrics_sparse(A: sp.csr_matrix, nodes, period: str, directed: bool = True) -> pd.DataFrame:
+    """
+    Compute the same node-level metrics as `calculate_node_metrics` on a
+    sparse adjacency matrix.
+
+    Degree metrics are obtained as row and column sums of the normalized
+    adjacency matrix, while closeness and betweenness centrality are derived
+    from the all-pairs shortest path distances computed by
+    ``scipy.sparse.csgraph.dijkstra`` on the inverse-weight matrix.
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_matrix
+        Square weighted adjacency matrix of the directed trade network, where
+        ``A[i, j]`` holds the ``qty`` traded from ``nodes[i]`` to ``nodes[j]``.
+        Weights are normalized internally.
+    nodes : array-like
+        Node identifiers, in the same order as the rows and columns of ``A``.
+    period : str
+        Period associated with the graph. This value is included in the
+        returned DataFrame.
+    directed : bool, optional
+        Whether ``A`` is a directed network. If False, each edge is stored
+        once in either direction, shortest paths ignore direction and the
+        in/out degrees and vulnerability are set to ``None``. Default is True.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame with the same columns as the one returned by
+        `calculate_node_metrics`.
+
+    Notes
+    -----
+    - Duplicate entries in ``A`` (e.g. the same pair of countries trading
+      several products) are summed.
+    - Distinctiveness centrality (D1) is computed on ``A + A.T``.
+    """
+    A = sp.csr_matrix(A, dtype=np.float64)
+    A.sum_duplicates()
+
+    total_weight = A.data.sum()
+    W = A / total_weight if total_weight > 0 else A * 0
+
+    out_deg = np.asarray(W.sum(axis=1)).ravel()
+    in_deg = np.asarray(W.sum(axis=0)).ravel()
+    deg = out_deg + in_deg
+    vulnerability = np.where(in_deg != 0, 1 - in_deg, 0)
+    if not directed:
+        out_deg = in_deg = vulnerability = [None] * W.shape[0]
+
+    # Shortest paths on the inverse weights (symmetric for undirected networks)
+    W_inv = W if directed else sp.csr_matrix(W + W.T - sp.diags(W.diagonal()))
+    W_inv = W_inv.copy()
+    W_inv.eliminate_zeros()
+    W_inv.data = 1 / W_inv.data
+    dist = dijkstra(W_inv, directed=directed)
+
+    clos = _closeness(dist)
+    betw = _betweenness(W_inv, dist)
+    disti = _distinctiveness(W)
+
     df_metrics = pd.DataFrame({
         "Period": period,
-        "Node": list(G.nodes()),
-        "Degree": [deg[n] for n in G.nodes()],
-        "Out Degree": [out_deg[n] for n in G.nodes()],
-        "In Degree": [in_deg[n] for n in G.nodes()],
-        "Vulnerability": [vulnerability[n] for n in G.nodes()],
-        "Closeness": [clos[n] for n in G.nodes()],
-        "Betweenness": [betw[n] for n in G.nodes()],
-        "Distinctiveness": [disti[n] for n in G.nodes()],
+        "Node": list(nodes),
+        "Degree": deg,
+        "Out Degree": out_deg,
+        "In Degree": in_deg,
+        "Vulnerability": vulnerability,
+        "Closeness": clos,
+        "Betweenness": betw,
+        "Distinctiveness": disti,
     })
 
     return df_metrics
+
+def _closeness(dist: np.ndarray) -> np.ndarray:
+    """
+    Compute closeness centrality from the all-pairs shortest path distances,
+    using inward distances and the Wasserman and Faust correction for
+    unreachable nodes, as networkx does.
+    """
+    n = dist.shape[0]
+    reachable = np.isfinite(dist)
+    n_reach = reachable.sum(axis=0) - 1
+    tot_dist = np.where(reachable, dist, 0).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(tot_dist > 0, n_reach / tot_dist * n_reach / max(n - 1, 1), 0.0)
+
+def _distinctiveness(W: sp.csr_matrix) -> np.ndarray:
+    """
+    Compute normalized distinctiveness centrality D1 (alpha = 1) on the
+    undirected version of the weighted adjacency matrix ``W``, i.e.
+    ``D1(i) = sum_j w_ij * log10((n - 1) / k_j)`` with ``k_j`` the degree of
+    ``j``, divided by its upper bound ``log10(n - 1) * (n - 1) * max(w)``.
+    """
+    n = W.shape[0]
+    S = W + W.T
+    S = sp.csr_matrix(S - sp.diags(S.diagonal()))
+    S.eliminate_zeros()
+    if n < 3 or S.nnz == 0:
+        return np.zeros(n)
+    k = np.diff(S.indptr)
+    d1 = S @ np.log10((n - 1) / np.maximum(k, 1))
+    return d1 / (np.log10(n - 1) * (n - 1) * S.data.max())
+
+def _betweenness(W_inv: sp.csr_matrix, dist: np.ndarray) -> np.ndarray:
+    """
+    Compute normalized betweenness centrality from the inverse-weight CSR
+    matrix and its all-pairs shortest path distances, using the
+    Numba-compiled kernel when numba is installed.
+    """
+    n = dist.shape[0]
+    order = np.argsort(dist, axis=1, kind="stable")
+    n_reach = np.isfinite(dist).sum(axis=1)
+    if _brandes_jit is not None:
+        betw = np.asarray(_brandes_jit(W_inv.indptr, W_inv.indices, W_inv.data, dist, order, n_reach))
+    else:
+        betw = np.asarray(_brandes(W_inv.indptr.tolist(), W_inv.indices.tolist(), W_inv.data.tolist(),
+                                   dist.tolist(), order.tolist(), n_reach.tolist()))
+    if n > 2:
+        betw = betw / ((n - 1) * (n - 2))
+    return betw
+
+# Tolerance, in units of d[w], used to detect equally short paths despite rounding
+_TIE_RTOL = 4 * np.finfo(np.float64).eps
+
+def _brandes(indptr, indices, data, dist, order, n_reach):
+    """
+    Accumulate Brandes' betweenness dependencies on a CSR graph, given the
+    shortest path distances ``dist`` and, for each source, the nodes sorted
+    by distance (``order``) and the number of reachable nodes (``n_reach``).
+    An edge (v, w) lies on a shortest path when d[w] > d[v] and d[v] plus
+    its length equals d[w] up to a few ulps of d[w] (``_TIE_RTOL``).
+    """
+    n = len(indptr) - 1
+    betw = [0.0] * n
+    sigma = [0.0] * n
+    delta = [0.0] * n
+    for s in range(n):
+        d = dist[s]
+        o = order[s]
+        r = n_reach[s]
+        for i in range(r):
+            sigma[o[i]] = 0.0
+            delta[o[i]] = 0.0
+        sigma[s] = 1.0
+        for i in range(r):
+            v = o[i]
+            for e in range(indptr[v], indptr[v + 1]):
+                w = indices[e]
+                if d[w] > d[v] and abs(d[v] + data[e] - d[w]) <= _TIE_RTOL * d[w]:
+                    sigma[w] += sigma[v]
+        for i in range(r - 1, -1, -1):
+            v = o[i]
+            for e in range(indptr[v], indptr[v + 1]):
+                w = indices[e]
+                if d[w] > d[v] and abs(d[v] + data[e] - d[w]) <= _TIE_RTOL * d[w]:
+                    delta[v] += sigma[v] / sigma[w] * (1 + delta[w])
+            if v != s:
+                betw[v] += delta[v]
+    return betw
+
+# The kernel is written so that it runs both as plain Python (on lists) and,
+# when the optional numba dependency is available, compiled (on arrays)
+_brandes_jit = njit(cache=True)(_brandes) if njit is not None else None
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 class TerraDataset:
@@ -61,7 +62,9 @@ class TerraDataset:
         trade-to-network conversion. If cols_map is provided, the 
         dataset columns are renamed before validation. This method also 
         handles validation of the optional second value column ("value")
-        when two_values=True.
+        when two_values=True. The "source", "target", "period" and
+        "product" columns are finally converted to categoricals and the
+        rows are sorted by period.
 
         Args:
             path (str): Path to the CSV file.
@@ -72,14 +75,35 @@ class TerraDataset:
         Raises:
             ValueError: If the dataset does not pass validation checks.
         """
-        df = pd.read_csv(path, sep=self.sep, encoding=self.encoding)
+        df = self._read_csv(path)
         if self.cols_map:
             df = self._rename_columns(df)
         self._base_checks(df)        
         
         if self.trade_to_network:
             df = self._trade_to_network(df)
-        
+
+        # Low-cardinality key columns, used for filtering and grouping
+        df = df.astype({c: "category" for c in ['source', 'target', 'period', 'product']})
+        # Stable sort by period once, so that per-period groupings follow the row order
+        df = df.sort_values('period', kind='mergesort').reset_index(drop=True)
+        return df
+
+    def _read_csv(self, path):
+        """
+        Read the CSV file with the multithreaded pyarrow parser when it is
+        installed, falling back to the default C parser otherwise.
+        """
+        try:
+            df = pd.read_csv(path, sep=self.sep, encoding=self.encoding, engine="pyarrow")
+        except (ImportError, ValueError):
+            # pyarrow is optional and does not support every option (e.g. regex separators)
+            return pd.read_csv(path, sep=self.sep, encoding=self.encoding)
+        # pyarrow parses ISO dates that the C parser keeps as text (e.g. periods):
+        # only the required columns, under their raw names, are checked
+        keys = [self.cols_map.get(k, k) for k in self.required_keys] if self.cols_map else self.required_keys
+        if any(pd.api.types.infer_dtype(df[c], skipna=True) in ("date", "datetime", "datetime64") for c in keys if c in df.columns):
+            return pd.read_csv(path, sep=self.sep, encoding=self.encoding)
         return df
 
     def _rename_columns(self, df: pd.DataFrame):
@@ -103,8 +127,10 @@ class TerraDataset:
                 f"Column renaming failed because the dataset already contains columns with the same name as the target names: {overlapping}"
             )
         
-        reverse_map = {v: k for k, v in self.cols_map.items()}
-        df.rename(columns=reverse_map, inplace=True)
+        # Identity pairs are left out, and rename is skipped if nothing changes
+        reverse_map = {v: k for k, v in self.cols_map.items() if k != v}
+        if reverse_map:
+            df.rename(columns=reverse_map, inplace=True)
         return df
     
     def _base_checks(self, df: pd.DataFrame):
@@ -124,7 +150,7 @@ class TerraDataset:
             (or 'value' when applicable) fails.
         """
         if not set(self.required_keys).issubset(df.columns):
-            raise ValueError(f"The dataframe must contain columns: {cols}")
+            raise ValueError(f"The dataframe must contain columns: {self.required_keys}")
         
         cols = [c for c in self.required_keys if c not in ['qty', 'value']]
         if (df.shape[0] != df[cols].drop_duplicates().shape[0]):
@@ -132,23 +158,24 @@ class TerraDataset:
             dups = dups[dups["qty"]>1][:3]
             raise ValueError(f"The dataframe has duplicate edges: first {dups.shape[0]} {dups.values.tolist()}...")
 
-        if pd.api.types.is_string_dtype(df["qty"]):
-            df["qty"] = df["qty"].str.replace(',','')
-            df["qty"] = df["qty"].str.replace('.','').astype(int)
+        # Separators are stripped only when the column does not parse as it is
         converted = pd.to_numeric(df["qty"], errors="coerce")
+        if converted.isna().any() and pd.api.types.is_string_dtype(df["qty"]):
+            converted = pd.to_numeric(df["qty"].str.translate(self._separators), errors="coerce")
 
         if converted.isna().any():
             invalid_values = df.loc[converted.isna(), "qty"].unique()[:5]
             raise ValueError(f"Column 'qty' contains non-numeric values. Examples: {invalid_values}...")
+        df["qty"] = converted
         if self.two_values:
-            if pd.api.types.is_string_dtype(df["value"]):
-                df["value"] = df["value"].str.replace(',','')
-                df["value"] = df["value"].str.replace('.','').astype(int)
             converted2 = pd.to_numeric(df["value"], errors="coerce")
+            if converted2.isna().any() and pd.api.types.is_string_dtype(df["value"]):
+                converted2 = pd.to_numeric(df["value"].str.translate(self._separators), errors="coerce")
 
             if converted2.isna().any():
                 invalid_values2 = df.loc[converted2.isna(), "value"].unique()[:5]
                 raise ValueError(f"Column 'value' contains non-numeric values. Examples: {invalid_values2}...")
+            df["value"] = converted2
     def _trade_to_network(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Convert a trade dataset into a network format.
@@ -170,18 +197,25 @@ class TerraDataset:
             ValueError: If the mode is invalid or if the resulting dataset
                 is empty.
         """
+        # Import flows are reported by the importer: swapping the column labels reverses them
+        swap = {'source': 'target', 'target': 'source'}
         if self.mode == 'import':
-            df = df[df['flow'] == self.imp_exp[0]][self.required_keys]
-            df.loc[:, ['source', 'target']] = df[['target', 'source']].values
+            df = df.loc[df['flow'] == self.imp_exp[0], self.required_keys].rename(columns=swap)[self.required_keys]
         elif self.mode == 'export':
-            df = df[df['flow'] == self.imp_exp[1]][self.required_keys]
+            df = df.loc[df['flow'] == self.imp_exp[1], self.required_keys]
         elif self.mode == 'both':
-            df_imp = df[df['flow'] == self.imp_exp[0]][self.required_keys]
-            df.loc[:, ['source', 'target']] = df[['target', 'source']].values
-            df_exp = df[df['flow'] == self.imp_exp[1]][self.required_keys]
+            df_imp = df.loc[df['flow'] == self.imp_exp[0], self.required_keys].rename(columns=swap)
+            df_exp = df.loc[df['flow'] == self.imp_exp[1], self.required_keys]
             df = pd.concat([df_imp, df_exp], ignore_index=True)
             cols = [c for c in self.required_keys if c not in ['qty', 'flow', 'value']]
-            df = df.groupby(cols, as_index=False)['qty'].mean() if not self.two_values else df.groupby(cols, as_index=False).agg({'qty':'mean','value':'mean'})
+            df = df.dropna(subset=cols)
+            # Mean of duplicated edges as sum / count over the factorized edge keys
+            codes, edges = pd.factorize(pd.MultiIndex.from_frame(df[cols]), sort=True)
+            counts = np.bincount(codes)
+            df_edges = edges.set_names(cols).to_frame(index=False)
+            for c in ['qty', 'value'] if self.two_values else ['qty']:
+                df_edges[c] = np.bincount(codes, weights=df[c].to_numpy(dtype=np.float64)) / counts
+            df = df_edges
         else:
             raise ValueError("mode must be 'import', 'export' or 'both'.")
         
@@ -190,4 +224,6 @@ class TerraDataset:
         return df
     
     # Required column groups: base columns, flow column, optional second value column
-    _required_cols = [['source', 'target', 'period', 'product', 'qty'],['flow'],['value']]
\ No newline at end of file
+    _required_cols = [['source', 'target', 'period', 'product', 'qty'],['flow'],['value']]
+    # Thousands and decimal separators removed from non-numeric value columns
+    _separators = str.maketrans("", "", ",.")